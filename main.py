@@ -13,14 +13,16 @@ Notes:
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import sqlite3, os, math
+import sqlite3, os, math, queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import pandas as pd
 
 # Matplotlib imports for embedding in Tkinter
 try:
     import matplotlib
-    matplotlib.use("Agg")  # safe backend for headless, embedding will switch when needed
+    matplotlib.use("TkAgg")  # render straight into the Tk canvas, no Agg->PhotoImage copy
     from matplotlib.figure import Figure
     from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
     MATPLOTLIB_AVAILABLE = True
@@ -40,48 +42,139 @@ def fayda_safia(pf):
     return pf - 500
 
 # ---- DB ----
+def _fts5_available():
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+FTS5_AVAILABLE = _fts5_available()
+
 def get_conn():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # Tune SQLite for a write-heavy local app: WAL avoids the rollback-journal
+    # fsync pair per commit and NORMAL drops one more fsync per transaction.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def get_ro_conn():
+    # Read-only companion to get_conn() for background readers; WAL mode is
+    # already set on the file, so only the per-connection PRAGMAs apply.
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=5000")
     return conn
 
+# tot_livraison/p_fayda/fayda_safia mirror the Calculations helpers above;
+# as STORED generated columns SQLite computes them at insert time.
+SALES_DDL = """CREATE TABLE IF NOT EXISTS Sales (
+    sale_id INTEGER PRIMARY KEY AUTOINCREMENT, invoice_no TEXT UNIQUE, client_id INTEGER, product_id INTEGER,
+    quantity INTEGER DEFAULT 1, purchase_price REAL, selling_price REAL, weight REAL, delivery_price REAL,
+    tot_livraison REAL GENERATED ALWAYS AS ((weight * 50) + delivery_price) STORED,
+    p_fayda REAL GENERATED ALWAYS AS ((selling_price - tot_livraison) - purchase_price) STORED,
+    fayda_safia REAL GENERATED ALWAYS AS (p_fayda - 500) STORED,
+    payment_method TEXT, status TEXT, paid INTEGER DEFAULT 0, date TEXT)"""
+
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS Clients (
+    # Migrate pre-generated-column databases first, so the index/trigger DDL
+    # below attaches to the rebuilt table. Column names and stored values are
+    # identical; the plain columns are simply copied across.
+    row = cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='Sales'").fetchone()
+    if row and "GENERATED" not in row[0]:
+        cur.execute("ALTER TABLE Sales RENAME TO Sales_old")
+        cur.execute(SALES_DDL)
+        cur.execute("""INSERT INTO Sales (sale_id, invoice_no, client_id, product_id, quantity,
+                purchase_price, selling_price, weight, delivery_price, payment_method, status, paid, date)
+            SELECT sale_id, invoice_no, client_id, product_id, quantity,
+                purchase_price, selling_price, weight, delivery_price, payment_method, status, paid, date
+            FROM Sales_old""")
+        cur.execute("DROP TABLE Sales_old")
+        conn.commit()
+    fts_exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name='sales_fts'").fetchone()
+    # All static DDL in one executescript: parsed and run in a single
+    # Python->C round instead of one per statement.
+    ddl = """CREATE TABLE IF NOT EXISTS Clients (
         client_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, phone TEXT, address TEXT, city TEXT,
-        total_spent REAL DEFAULT 0, total_orders INTEGER DEFAULT 0)""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS Products (
+        total_spent REAL DEFAULT 0, total_orders INTEGER DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS Products (
         product_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, purchase_price REAL NOT NULL, weight REAL,
-        default_delivery_price REAL DEFAULT 0, selling_price REAL, stock_qty INTEGER DEFAULT 0)""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS Sales (
-        sale_id INTEGER PRIMARY KEY AUTOINCREMENT, invoice_no TEXT UNIQUE, client_id INTEGER, product_id INTEGER,
-        quantity INTEGER DEFAULT 1, purchase_price REAL, selling_price REAL, weight REAL, delivery_price REAL,
-        tot_livraison REAL, p_fayda REAL, fayda_safia REAL, payment_method TEXT, status TEXT, paid INTEGER DEFAULT 0, date TEXT)""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS SponsoredFees (
-        fee_id INTEGER PRIMARY KEY AUTOINCREMENT, campaign_name TEXT NOT NULL, platform TEXT, amount_spent REAL NOT NULL, date TEXT)""")
-    conn.commit()
+        default_delivery_price REAL DEFAULT 0, selling_price REAL, stock_qty INTEGER DEFAULT 0);
+    """ + SALES_DDL + """;
+    CREATE TABLE IF NOT EXISTS SponsoredFees (
+        fee_id INTEGER PRIMARY KEY AUTOINCREMENT, campaign_name TEXT NOT NULL, platform TEXT, amount_spent REAL NOT NULL, date TEXT);
+    CREATE TABLE IF NOT EXISTS InvoiceSeq (
+        year INTEGER PRIMARY KEY, seq INTEGER NOT NULL DEFAULT 0);
+    -- Seed the sequence from invoices written before InvoiceSeq existed so
+    -- numbering continues where the old LIKE-scan left off.
+    INSERT OR IGNORE INTO InvoiceSeq (year, seq)
+        SELECT CAST(substr(invoice_no, 7, 4) AS INTEGER), MAX(CAST(substr(invoice_no, 12) AS INTEGER))
+        FROM Sales WHERE invoice_no LIKE 'DZAIR-%' GROUP BY 1;
+    -- Indexes for the dashboard/filter queries; Sales grows unbounded and
+    -- would otherwise be scanned in full on every refresh. The covering
+    -- index answers the 14-day profit aggregate from the index alone.
+    CREATE INDEX IF NOT EXISTS idx_sales_date ON Sales(date);
+    CREATE INDEX IF NOT EXISTS idx_sales_client ON Sales(client_id);
+    CREATE INDEX IF NOT EXISTS idx_sales_product ON Sales(product_id);
+    CREATE INDEX IF NOT EXISTS idx_sales_date_profit ON Sales(date, p_fayda, tot_livraison);
+    """
+    if FTS5_AVAILABLE:
+        # Inverted index over the searchable sale fields; %term% LIKEs can
+        # never use a B-tree index, FTS5 MATCH can.
+        ddl += """CREATE VIRTUAL TABLE IF NOT EXISTS sales_fts USING fts5(
+            invoice_no, status, client_name, product_name, content='');
+        CREATE TRIGGER IF NOT EXISTS sales_fts_ai AFTER INSERT ON Sales BEGIN
+            INSERT INTO sales_fts (rowid, invoice_no, status, client_name, product_name)
+            VALUES (new.sale_id, new.invoice_no, new.status,
+                COALESCE((SELECT name FROM Clients WHERE client_id=new.client_id), ''),
+                COALESCE((SELECT name FROM Products WHERE product_id=new.product_id), ''));
+        END;
+        """
+    conn.executescript(ddl)
+    if FTS5_AVAILABLE and not fts_exists:
+        # index sales written before the virtual table existed
+        cur.execute("""INSERT INTO sales_fts (rowid, invoice_no, status, client_name, product_name)
+            SELECT S.sale_id, S.invoice_no, S.status, COALESCE(C.name,''), COALESCE(P.name,'')
+            FROM Sales S LEFT JOIN Clients C ON S.client_id=C.client_id
+            LEFT JOIN Products P ON S.product_id=P.product_id""")
+        conn.commit()
     conn.close()
 
-def generate_invoice_no(conn, date_str=None):
+def generate_invoice_no(cur, date_str=None):
     if date_str is None:
         date_str = datetime.now().strftime("%Y-%m-%d")
-    year = datetime.fromisoformat(date_str).year
-    cur = conn.cursor()
-    cur.execute("SELECT invoice_no FROM Sales WHERE invoice_no LIKE ? ORDER BY sale_id DESC LIMIT 1", (f'DZAIR-{year}-%',))
-    row = cur.fetchone()
-    if row is None:
-        seq = 1
-    else:
-        last = row[0]
-        try:
-            seq = int(last.split('-')[-1]) + 1
-        except:
-            seq = 1
+    # dates are always YYYY-MM-DD here; a slice+int beats fromisoformat ~10x,
+    # which matters when this runs once per row in a bulk import
+    year = int(date_str[:4])
+    cur.execute("""INSERT INTO InvoiceSeq (year, seq) VALUES (?, 1)
+        ON CONFLICT(year) DO UPDATE SET seq = seq + 1 RETURNING seq""", (year,))
+    seq = cur.fetchone()[0]
     return f"DZAIR-{year}-{seq:03d}"
 
+def search_filter(s):
+    """Return (sql_fragment, params) for the toolbar search term."""
+    if FTS5_AVAILABLE:
+        # quoted prefix query so the term is matched verbatim, as LIKE did
+        return (" AND S.sale_id IN (SELECT rowid FROM sales_fts WHERE sales_fts MATCH ?)",
+                ['"%s"*' % s.replace('"', '""')])
+    sparam = f"%{s}%"
+    return (" AND (C.name LIKE ? OR P.name LIKE ? OR S.invoice_no LIKE ? OR S.status LIKE ?)",
+            [sparam, sparam, sparam, sparam])
+
 # ---- App ----
 class App(ttk.Frame):
+    SALES_PAGE = 500  # rows fetched per scroll window in the Sales tree
+
     def __init__(self, root):
         super().__init__(root)
         self.root = root
@@ -100,7 +193,15 @@ class App(ttk.Frame):
 
         init_db()
         self.conn = get_conn()
+        # small pool of pre-opened read-only connections for background work
+        # (threaded exports etc.), amortizing fd open + PRAGMA setup
+        self._conn_pool = queue.Queue()
+        for _ in range(4): self._conn_pool.put(get_ro_conn())
+        self._sales_query = None; self._sales_params = []
+        self._sales_offset = 0; self._sales_exhausted = True
+        self._refresh_after_id = None
         self.create_widgets()
+        self._rebuild_entity_maps()
         self.refresh_all()
 
     def create_widgets(self):
@@ -119,7 +220,9 @@ class App(ttk.Frame):
         self.search_var = tk.StringVar()
         search_entry = ttk.Entry(toolbar, textvariable=self.search_var, width=30)
         search_entry.pack(side="left")
-        search_entry.bind("<Return>", lambda e: self.refresh_sales())
+        # live filter, debounced so a burst of keystrokes runs one query
+        search_entry.bind("<Return>", lambda e: self._schedule_refresh())
+        search_entry.bind("<KeyRelease>", lambda e: self._schedule_refresh())
 
         ttk.Label(toolbar, text="From:").pack(side="left", padx=(10,4))
         self.date_from = ttk.Entry(toolbar, width=12)
@@ -145,6 +248,25 @@ class App(ttk.Frame):
         mapping = {"Clients":0, "Products":1, "Sales":2, "Dashboard":3, "Fees":4, "Reports":5}
         idx = mapping.get(name, 0); self.nb.select(idx)
 
+    @contextmanager
+    def borrow_conn(self):
+        conn = self._conn_pool.get()
+        try:
+            yield conn
+        finally:
+            self._conn_pool.put(conn)
+
+    @contextmanager
+    def _bulk_update(self, tree):
+        # Clear with a single C-level delete and detach the widget while
+        # repopulating, so Tk does one layout pass instead of one per row.
+        tree.delete(*tree.get_children())
+        tree.pack_forget()
+        try:
+            yield tree
+        finally:
+            tree.pack(fill="both", expand=True)
+
     # ------------- Clients -------------
     def build_clients_tab(self):
         frame = self.tab_clients
@@ -172,12 +294,12 @@ class App(ttk.Frame):
         cur.execute("INSERT INTO Clients (name, phone, address, city) VALUES (?, ?, ?, ?)", (name, self.c_phone.get().strip(), self.c_address.get().strip(), self.c_city.get().strip()))
         self.conn.commit(); messagebox.showinfo("OK","Client added.")
         self.c_name.delete(0,'end'); self.c_phone.delete(0,'end'); self.c_address.delete(0,'end'); self.c_city.delete(0,'end')
-        self.refresh_clients()
+        self._rebuild_entity_maps(); self.refresh_clients()
 
     def refresh_clients(self):
-        for r in self.clients_tree.get_children(): self.clients_tree.delete(r)
-        cur = self.conn.cursor()
-        for row in cur.execute("SELECT * FROM Clients ORDER BY client_id DESC"): self.clients_tree.insert("", "end", values=tuple(row))
+        rows = self.conn.execute("SELECT * FROM Clients ORDER BY client_id DESC").fetchall()
+        with self._bulk_update(self.clients_tree) as tree:
+            for row in rows: tree.insert("", "end", values=list(row))
 
     # ------------- Products -------------
     def build_products_tab(self):
@@ -213,20 +335,22 @@ class App(ttk.Frame):
                     (name, purchase, weight, default_del, selling, stock))
         self.conn.commit(); messagebox.showinfo("OK","Product added.")
         for e in (self.p_name, self.p_purchase, self.p_weight, self.p_del, self.p_sell, self.p_stock): e.delete(0,'end')
-        self.refresh_products()
+        self._rebuild_entity_maps(); self.refresh_products()
 
     def refresh_products(self):
-        for r in self.products_tree.get_children(): self.products_tree.delete(r)
-        cur = self.conn.cursor()
-        for row in cur.execute("SELECT * FROM Products ORDER BY product_id DESC"): self.products_tree.insert("", "end", values=tuple(row))
+        rows = self.conn.execute("SELECT * FROM Products ORDER BY product_id DESC").fetchall()
+        with self._bulk_update(self.products_tree) as tree:
+            for row in rows: tree.insert("", "end", values=list(row))
 
     # ------------- Sales -------------
     def build_sales_tab(self):
         frame = self.tab_sales
         top = ttk.Frame(frame, padding=8); top.pack(fill="x")
         # client/product selectors
-        ttk.Label(top, text="Client").grid(row=0,column=0, sticky="w"); self.sale_client = ttk.Combobox(top, width=40); self.sale_client.grid(row=0,column=1, sticky="w")
-        ttk.Label(top, text="Product").grid(row=1,column=0, sticky="w"); self.sale_product = ttk.Combobox(top, width=40); self.sale_product.grid(row=1,column=1, sticky="w")
+        # postcommand runs synchronously before the dropdown reads -values,
+        # so lazy population can never race the popdown
+        ttk.Label(top, text="Client").grid(row=0,column=0, sticky="w"); self.sale_client = ttk.Combobox(top, width=40, postcommand=self._populate_sale_selectors); self.sale_client.grid(row=0,column=1, sticky="w")
+        ttk.Label(top, text="Product").grid(row=1,column=0, sticky="w"); self.sale_product = ttk.Combobox(top, width=40, postcommand=self._populate_sale_selectors); self.sale_product.grid(row=1,column=1, sticky="w")
         ttk.Label(top, text="Qty").grid(row=0,column=2, sticky="w"); self.sale_qty = ttk.Entry(top, width=8); self.sale_qty.grid(row=0,column=3, sticky="w")
         ttk.Label(top, text="Delivery (opt)").grid(row=1,column=2, sticky="w"); self.sale_delivery = ttk.Entry(top, width=8); self.sale_delivery.grid(row=1,column=3, sticky="w")
         ttk.Label(top, text="Payment").grid(row=2,column=0, sticky="w"); self.sale_payment = ttk.Combobox(top, values=["Cash","BaridiMob","CCP","Bank"]); self.sale_payment.grid(row=2,column=1, sticky="w")
@@ -239,8 +363,9 @@ class App(ttk.Frame):
         cols = ("sale_id","invoice_no","date","client","product","qty","selling_price","tot_livraison","p_fayda","fayda_safia","status")
         self.sales_tree = ttk.Treeview(mid, columns=cols, show="headings", selectmode="browse")
         for c in cols: self.sales_tree.heading(c, text=c)
-        vsb = ttk.Scrollbar(mid, orient="vertical", command=self.sales_tree.yview"); self.sales_tree.configure(yscroll=vsb.set)
-        vsb.pack(side="right", fill="y"); self.sales_tree.pack(fill="both", expand=True)
+        self.sales_vsb = ttk.Scrollbar(mid, orient="vertical", command=self.sales_tree.yview)
+        self.sales_tree.configure(yscroll=self._on_sales_scroll)
+        self.sales_vsb.pack(side="right", fill="y"); self.sales_tree.pack(fill="both", expand=True)
 
         # bottom buttons
         bottom = ttk.Frame(frame); bottom.pack(fill="x", padx=8, pady=6)
@@ -248,47 +373,93 @@ class App(ttk.Frame):
         ttk.Button(bottom, text="Export Filtered to Excel", command=self.export_filtered_excel).pack(side="left", padx=6)
         ttk.Button(bottom, text="Export Selected Invoice to PDF", command=self.export_invoice_pdf).pack(side="left", padx=6)
 
-    def refresh_sales(self):
-        # load client/product maps
+    def _rebuild_entity_maps(self):
+        # Clients/Products only change through add_client/add_product, so the
+        # selector maps are rebuilt there instead of on every filter apply.
         cur = self.conn.cursor()
         cur.execute("SELECT client_id, name FROM Clients ORDER BY name"); clients = cur.fetchall()
-        self.client_map = {f\"{r['name']} ({r['client_id']})\": r['client_id'] for r in clients}
-        self.sale_client['values'] = list(self.client_map.keys())
+        self.client_map = {f"{r['name']} ({r['client_id']})": r['client_id'] for r in clients}
+        self.client_id_to_name = {r['client_id']: r['name'] for r in clients}
         cur.execute("SELECT product_id, name FROM Products ORDER BY name"); products = cur.fetchall()
-        self.product_map = {f\"{r['name']} ({r['product_id']})\": r['product_id'] for r in products}
+        self.product_map = {f"{r['name']} ({r['product_id']})": r['product_id'] for r in products}
+        self.product_id_to_name = {r['product_id']: r['name'] for r in products}
+        self._combobox_dirty = True
+
+    def _populate_sale_selectors(self):
+        # fill the comboboxes only when a dropdown is about to open
+        if not self._combobox_dirty: return
+        self.sale_client['values'] = list(self.client_map.keys())
         self.sale_product['values'] = list(self.product_map.keys())
+        self._combobox_dirty = False
 
-        # Build query with filters
-        q = \"\"\"SELECT S.*, C.name as client_name, P.name as product_name FROM Sales S
-                 LEFT JOIN Clients C ON S.client_id=C.client_id
-                 LEFT JOIN Products P ON S.product_id=P.product_id WHERE 1=1\"\"\"
-        params = []
+    def _schedule_refresh(self):
+        if self._refresh_after_id is not None:
+            self.root.after_cancel(self._refresh_after_id)
+        self._refresh_after_id = self.root.after(150, self._debounced_refresh)
+
+    def _debounced_refresh(self):
+        self._refresh_after_id = None
+        self.refresh_sales()
+
+    def refresh_sales(self):
         s = self.search_var.get().strip()
-        if s:
-            q += \" AND (C.name LIKE ? OR P.name LIKE ? OR S.invoice_no LIKE ? OR S.status LIKE ?)\")
-            sparam = f\"%{s}%\"
-            params.extend([sparam, sparam, sparam, sparam])
-        # date range filters in YYYY-MM-DD - if empty ignore
         df = self.date_from.get().strip()
         dt = self.date_to.get().strip()
-        if df:
-            try:
-                datetime.fromisoformat(df)
-                q += \" AND date(S.date) >= date(?)\"; params.append(df)
-            except Exception:
-                messagebox.showerror(\"Date Error\", \"From date must be YYYY-MM-DD\"); return
-        if dt:
-            try:
-                datetime.fromisoformat(dt)
-                q += \" AND date(S.date) <= date(?)\"; params.append(dt)
-            except Exception:
-                messagebox.showerror(\"Date Error\", \"To date must be YYYY-MM-DD\"); return
-        q += \" ORDER BY S.sale_id DESC\"
-        # execute and populate tree
-        for r in self.sales_tree.get_children(): self.sales_tree.delete(r)
+        if not s and not df and not dt:
+            # common browse path: no filters active, so skip the LEFT JOINs and
+            # resolve names from the cached id->name maps instead
+            q = "SELECT * FROM Sales S ORDER BY S.sale_id DESC"; params = []
+            self._sales_joined = False
+        else:
+            # Build query with filters
+            q = """SELECT S.*, C.name as client_name, P.name as product_name FROM Sales S
+                     LEFT JOIN Clients C ON S.client_id=C.client_id
+                     LEFT JOIN Products P ON S.product_id=P.product_id WHERE 1=1"""
+            params = []
+            if s:
+                frag, fparams = search_filter(s)
+                q += frag; params.extend(fparams)
+            # date range filters in YYYY-MM-DD - if empty ignore
+            if df:
+                try:
+                    datetime.fromisoformat(df)
+                    q += " AND S.date >= ?"; params.append(df)
+                except Exception:
+                    messagebox.showerror("Date Error", "From date must be YYYY-MM-DD"); return
+            if dt:
+                try:
+                    datetime.fromisoformat(dt)
+                    q += " AND S.date <= ?"; params.append(dt)
+                except Exception:
+                    messagebox.showerror("Date Error", "To date must be YYYY-MM-DD"); return
+            q += " ORDER BY S.sale_id DESC"
+            self._sales_joined = True
+        # load the first window; further pages stream in as the user scrolls
+        self._sales_query = q; self._sales_params = params
+        self._sales_offset = 0; self._sales_exhausted = False
+        with self._bulk_update(self.sales_tree):
+            self._load_sales_page()
+
+    def _load_sales_page(self):
         cur = self.conn.cursor()
-        for row in cur.execute(q, params):
-            self.sales_tree.insert('', 'end', values=(row['sale_id'], row['invoice_no'], row['date'], row['client_name'], row['product_name'], row['quantity'], row['selling_price'], row['tot_livraison'], row['p_fayda'], row['fayda_safia'], row['status']))
+        rows = cur.execute(self._sales_query + " LIMIT ? OFFSET ?",
+                           self._sales_params + [self.SALES_PAGE, self._sales_offset]).fetchall()
+        for row in rows:
+            if self._sales_joined:
+                client_name = row['client_name']; product_name = row['product_name']
+            else:
+                client_name = self.client_id_to_name.get(row['client_id'])
+                product_name = self.product_id_to_name.get(row['product_id'])
+            self.sales_tree.insert('', 'end', values=(row['sale_id'], row['invoice_no'], row['date'], client_name, product_name, row['quantity'], row['selling_price'], row['tot_livraison'], row['p_fayda'], row['fayda_safia'], row['status']))
+        self._sales_offset += len(rows)
+        if len(rows) < self.SALES_PAGE: self._sales_exhausted = True
+
+    def _on_sales_scroll(self, first, last):
+        # yscrollcommand proxy: keep the scrollbar in sync and fetch the next
+        # page when the view approaches the bottom of what is loaded.
+        self.sales_vsb.set(first, last)
+        if not self._sales_exhausted and float(last) > 0.9:
+            self._load_sales_page()
 
     def add_sale(self):
         client_key = self.sale_client.get(); prod_key = self.sale_product.get()
@@ -312,12 +483,21 @@ class App(ttk.Frame):
         if not prod: messagebox.showerror("Error", "Product not found"); return
         purchase_price = prod['purchase_price']; weight = prod['weight'] or 0; default_del = prod['default_delivery_price'] or 0; selling_price = prod['selling_price'] or 0
         if delivery_price is None: delivery_price = default_del
-        tot_liv = tot_livraison(weight, delivery_price); pf = p_fayda(selling_price, tot_liv, purchase_price); fs = fayda_safia(pf)
-        invoice = generate_invoice_no(self.conn, date_str)
-        cur.execute("INSERT INTO Sales (invoice_no, client_id, product_id, quantity, purchase_price, selling_price, weight, delivery_price, tot_livraison, p_fayda, fayda_safia, payment_method, status, paid, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (invoice, client_id, product_id, qty, purchase_price, selling_price, weight, delivery_price, tot_liv, pf, fs, payment, status, 1 if status=='Delivered' else 0, date_str))
-        cur.execute("UPDATE Clients SET total_spent = total_spent + ?, total_orders = total_orders + 1 WHERE client_id = ?", (selling_price*qty, client_id))
-        cur.execute("UPDATE Products SET stock_qty = stock_qty - ? WHERE product_id = ?", (qty, product_id))
-        self.conn.commit(); messagebox.showinfo("Sale Added", f"Invoice: {invoice}"); self.refresh_sales()
+        # One BEGIN IMMEDIATE .. COMMIT around the whole sale: the invoice
+        # lookup, the INSERT and the two UPDATEs cost a single fsync. Roll
+        # back on any failure so the connection never stays in_transaction.
+        # tot_livraison/p_fayda/fayda_safia are generated columns now.
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            invoice = generate_invoice_no(cur, date_str)
+            cur.execute("INSERT INTO Sales (invoice_no, client_id, product_id, quantity, purchase_price, selling_price, weight, delivery_price, payment_method, status, paid, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (invoice, client_id, product_id, qty, purchase_price, selling_price, weight, delivery_price, payment, status, 1 if status=='Delivered' else 0, date_str))
+            cur.execute("UPDATE Clients SET total_spent = total_spent + ?, total_orders = total_orders + 1 WHERE client_id = ?", (selling_price*qty, client_id))
+            cur.execute("UPDATE Products SET stock_qty = stock_qty - ? WHERE product_id = ?", (qty, product_id))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"Sale not saved: {e}"); return
+        messagebox.showinfo("Sale Added", f"Invoice: {invoice}"); self.refresh_sales()
 
     # ------------- Dashboard -------------
     def build_dashboard_tab(self):
@@ -330,9 +510,13 @@ class App(ttk.Frame):
         # chart area
         self.chart_frame = ttk.Frame(frame); self.chart_frame.pack(fill="both", expand=True, padx=8, pady=8)
         if MATPLOTLIB_AVAILABLE:
-            # create a matplotlib Figure
+            # create a matplotlib Figure; the line and labels are created once
+            # and only their data changes on refresh
             self.fig = Figure(figsize=(6,4), dpi=100)
             self.ax = self.fig.add_subplot(111)
+            (self._line,) = self.ax.plot([], [], marker='o')
+            self.ax.set_title("Profit last 14 days"); self.ax.set_ylabel("Profit")
+            self._no_data = self.ax.text(0.5, 0.5, "No data", transform=self.ax.transAxes, ha='center', va='center')
             self.canvas = FigureCanvasTkAgg(self.fig, master=self.chart_frame)
             self.canvas.get_tk_widget().pack(fill="both", expand=True)
         else:
@@ -340,21 +524,27 @@ class App(ttk.Frame):
 
     def refresh_dashboard(self):
         cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM Sales"); sales_count = cur.fetchone()[0]
-        cur.execute("SELECT SUM(p_fayda) FROM Sales"); total_profit = cur.fetchone()[0] or 0
-        cur.execute("SELECT SUM(tot_livraison) FROM Sales"); total_delivery = cur.fetchone()[0] or 0
+        # Single pass over Sales for all three totals instead of three round-trips
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(p_fayda),0), COALESCE(SUM(tot_livraison),0) FROM Sales")
+        sales_count, total_profit, total_delivery = cur.fetchone()
         self.lbl_sales.config(text=f"Sales: {sales_count}"); self.lbl_profit.config(text=f"Profit: {total_profit:.2f}"); self.lbl_delivery.config(text=f"Delivery: {total_delivery:.2f}")
         if MATPLOTLIB_AVAILABLE:
             # Sales per day (last 14 days)
-            cur.execute("SELECT date, SUM(p_fayda) as profit, COUNT(*) as cnt FROM Sales WHERE date >= date('now','-13 days') GROUP BY date ORDER BY date")
-            rows = cur.fetchall(); dates = [r[0] for r in rows]; profits = [r[1] for r in rows]
-            self.ax.clear()
+            cur.execute("SELECT date, SUM(p_fayda) as profit FROM Sales WHERE date >= date('now','-13 days') GROUP BY date ORDER BY date")
+            rows = cur.fetchall()
+            dates, profits = zip(*rows) if rows else ((), ())
+            # update the existing artists instead of clear()+replot, which
+            # would redo tick/label layout every refresh
             if dates:
-                self.ax.plot(dates, profits, marker='o')
-                self.ax.set_title("Profit last 14 days"); self.ax.set_ylabel("Profit"); self.ax.set_xticks(dates[::max(1,len(dates)//7)])
-                for label in self.ax.get_xticklabels(): label.set_rotation(30)
+                self._no_data.set_visible(False)
+                xs = range(len(dates))
+                self._line.set_data(xs, profits)
+                step = max(1, len(dates)//7)
+                self.ax.set_xticks(xs[::step]); self.ax.set_xticklabels(dates[::step], rotation=30)
+                self.ax.relim(); self.ax.autoscale_view()
             else:
-                self.ax.text(0.5, 0.5, "No data", ha='center', va='center')
+                self._no_data.set_visible(True)
+                self._line.set_data([], [])
             self.canvas.draw()
 
     # ------------- Sponsored Fees -------------
@@ -384,9 +574,9 @@ class App(ttk.Frame):
         messagebox.showinfo("OK","Fee added"); self.refresh_fees(); self.f_name.delete(0,'end'); self.f_platform.delete(0,'end'); self.f_amount.delete(0,'end')
 
     def refresh_fees(self):
-        for r in self.fees_tree.get_children(): self.fees_tree.delete(r)
-        cur = self.conn.cursor()
-        for row in cur.execute("SELECT * FROM SponsoredFees ORDER BY fee_id DESC"): self.fees_tree.insert("", "end", values=tuple(row))
+        rows = self.conn.execute("SELECT * FROM SponsoredFees ORDER BY fee_id DESC").fetchall()
+        with self._bulk_update(self.fees_tree) as tree:
+            for row in rows: tree.insert("", "end", values=list(row))
 
     # ------------- Reports & Export -------------
     def build_reports_tab(self):
@@ -399,42 +589,68 @@ class App(ttk.Frame):
     def export_all_excel(self):
         path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel","*.xlsx")])
         if not path: return
-        df_clients = pd.read_sql_query("SELECT * FROM Clients", self.conn)
-        df_products = pd.read_sql_query("SELECT * FROM Products", self.conn)
-        df_sales = pd.read_sql_query("SELECT * FROM Sales", self.conn)
-        df_fees = pd.read_sql_query("SELECT * FROM SponsoredFees", self.conn)
-        with pd.ExcelWriter(path) as writer:
-            df_clients.to_excel(writer, sheet_name="Clients", index=False)
-            df_products.to_excel(writer, sheet_name="Products", index=False)
-            df_sales.to_excel(writer, sheet_name="Sales", index=False)
-            df_fees.to_excel(writer, sheet_name="SponsoredFees", index=False)
+        # WAL permits concurrent readers: load the four tables in parallel on
+        # read-only connections instead of serially on the UI connection.
+        def load(table):
+            with self.borrow_conn() as conn:
+                return pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        tables = ("Clients", "Products", "Sales", "SponsoredFees")
+        with ThreadPoolExecutor(max_workers=len(tables)) as ex:
+            dfs = list(ex.map(load, tables))
+        # constant_memory is incompatible with to_excel's column-order writes
+        # (rows flush permanently and later columns are dropped), so plain
+        # xlsxwriter it is
+        with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+            for table, df in zip(tables, dfs):
+                df.to_excel(writer, sheet_name=table, index=False)
         messagebox.showinfo("Exported", f"Saved to {path}")
 
     def export_filtered_excel(self):
         # export current sales view (with filters applied)
-        path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel","*.xlsx")])
+        path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel","*.xlsx"),("CSV","*.csv")])
         if not path: return
         # Reuse query builder from refresh_sales but without populating UI
         q = "SELECT S.*, C.name as client_name, P.name as product_name FROM Sales S LEFT JOIN Clients C ON S.client_id=C.client_id LEFT JOIN Products P ON S.product_id=P.product_id WHERE 1=1"
         params = []
         s = self.search_var.get().strip()
-        if s: q += " AND (C.name LIKE ? OR P.name LIKE ? OR S.invoice_no LIKE ? OR S.status LIKE ?)"; sparam = f"%{s}%"; params.extend([sparam,sparam,sparam,sparam])
+        if s: frag, fparams = search_filter(s); q += frag; params.extend(fparams)
         df = self.date_from.get().strip(); dt = self.date_to.get().strip()
         if df:
-            try: datetime.fromisoformat(df); q += " AND date(S.date) >= date(?)"; params.append(df)
+            try: datetime.fromisoformat(df); q += " AND S.date >= ?"; params.append(df)
             except: messagebox.showerror("Date Error", "From date must be YYYY-MM-DD"); return
         if dt:
-            try: datetime.fromisoformat(dt); q += " AND date(S.date) <= date(?)"; params.append(dt)
+            try: datetime.fromisoformat(dt); q += " AND S.date <= ?"; params.append(dt)
             except: messagebox.showerror("Date Error", "To date must be YYYY-MM-DD"); return
         q += " ORDER BY S.sale_id DESC"
         df_sales = pd.read_sql_query(q, self.conn, params=params)
-        df_sales.to_excel(path, index=False)
+        if path.lower().endswith(".csv"):
+            df_sales.to_csv(path, index=False)
+        else:
+            with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+                df_sales.to_excel(writer, sheet_name="Sales", index=False)
+                if not df_sales.empty:
+                    self._client_profit_summary(df_sales).to_excel(writer, sheet_name="ProfitByClient")
         messagebox.showinfo("Exported", f"Filtered sales saved to {path}")
 
+    def _client_profit_summary(self, df_sales):
+        # per-client profit totals for the export's summary sheet; numba JITs
+        # the aggregation when installed (worth it beyond ~100k rows), plain
+        # pandas sum otherwise
+        grouped = df_sales.groupby("client_id")["p_fayda"]
+        try:
+            import numba  # noqa: F401
+        except Exception:
+            return grouped.sum()
+        def nb_sum(values, index):
+            return values.sum()
+        return grouped.agg(nb_sum, engine="numba")
+
     def export_invoice_pdf(self):
         try:
+            from reportlab.lib import colors
             from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
+            from reportlab.lib.styles import getSampleStyleSheet
+            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
         except Exception:
             messagebox.showerror("Error", "reportlab not installed. Install with: pip install reportlab"); return
         sel = self.sales_tree.selection()
@@ -446,11 +662,25 @@ class App(ttk.Frame):
         if not row: messagebox.showerror("Error", "Sale not found"); return
         path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF","*.pdf")])
         if not path: return
-        c = canvas.Canvas(path, pagesize=A4); x=50; y=800; c.setFont("Helvetica-Bold",14); c.drawString(x,y,"DZAIR - Invoice"); y-=30; c.setFont("Helvetica",10)
-        c.drawString(x,y,f"Invoice: {row['invoice_no']}"); y-=15; c.drawString(x,y,f"Date: {row['date']}"); y-=15
-        c.drawString(x,y,f"Client: {row['client_name']} | Phone: {row['phone']}"); y-=15; c.drawString(x,y,f"Address: {row['address']}"); y-=20
-        c.drawString(x,y,f"Product: {row['product_name']} x {row['quantity']}"); y-=15; c.drawString(x,y,f"Selling Price: {row['selling_price']}"); y-=15
-        c.drawString(x,y,f"Delivery: {row['delivery_price']}"); y-=15; c.drawString(x,y,f"P FAYDA: {row['p_fayda']}"); y-=15; c.drawString(x,y,f"FAYDA SAFIA: {row['fayda_safia']}"); c.showPage(); c.save()
+        # Platypus lays out the rows itself; adding line items later is just
+        # more rows in `data`, no manual y-coordinate bookkeeping.
+        data = [["Invoice", row['invoice_no']],
+                ["Date", row['date']],
+                ["Client", f"{row['client_name']} | Phone: {row['phone']}"],
+                ["Address", row['address']],
+                ["Product", f"{row['product_name']} x {row['quantity']}"],
+                ["Selling Price", row['selling_price']],
+                ["Delivery", row['delivery_price']],
+                ["P FAYDA", row['p_fayda']],
+                ["FAYDA SAFIA", row['fayda_safia']]]
+        table = Table(data, hAlign="LEFT")
+        table.setStyle(TableStyle([
+            ("FONTNAME", (0,0), (0,-1), "Helvetica-Bold"),
+            ("FONTSIZE", (0,0), (-1,-1), 10),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.grey)]))
+        styles = getSampleStyleSheet()
+        doc = SimpleDocTemplate(path, pagesize=A4)
+        doc.build([Paragraph("DZAIR - Invoice", styles["Title"]), Spacer(1, 12), table])
         messagebox.showinfo("Saved", f"Invoice saved to {path}")
 
     def backup_db(self):